@@ -9,7 +9,6 @@ reduction automatically.
 """
 
 import contextlib
-from itertools import chain
 import logging
 from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple, Union
 
@@ -117,8 +116,12 @@ class ShardedDataParallel(nn.Module):
         # several optimizers can be present each working on seperate parameter set which is spread across multiple ranks
 
         # - we build an iterator which goes through all the parameters involved globally
-        all_param_iterator = chain(
-            *[sum([sum(p, []) for p in optim.per_device_params.values()], []) for optim in self.sharded_optimizers]
+        all_param_iterator = (
+            param
+            for optim in self.sharded_optimizers
+            for per_rank_params in optim.per_device_params.values()
+            for params in per_rank_params
+            for param in params
         )
         self._grad_to_be_reduced = [True for _ in filter(lambda x: x.requires_grad, all_param_iterator)]
 
@@ -387,51 +390,54 @@ class ShardedDataParallel(nn.Module):
 
     def _setup_bucket_strategy(self) -> None:
         """Devise a bucketing strategy on a per-rank ownership level. These buckets will not be sharded, since the gradients would be re-allocated during the backward in that case.
+        The bucketed gradients are selected first, so that each bucket can be allocated to its exact size.
         """
 
         if not self.use_buckets:
             return
 
-        # - Allocate one buffer per rank and per device to group the small parameters
-        for sharded_optimizer in self.sharded_optimizers:
-            for device, per_device in sharded_optimizer.per_device_params.items():
-                self.buckets[sharded_optimizer][device] = [
-                    Bucket(buffer=torch.zeros(self.buffer_max_size, dtype=per_device[0][0].dtype, device=device))
-                    for _ in per_device
-                ]
-
-        # Devise the bucketing strategy
         for sharded_optimizer in self.sharded_optimizers:
             for device, per_rank_params in sharded_optimizer.per_device_params.items():
+                self.buckets[sharded_optimizer][device] = []
+
                 for dst_rank, params in enumerate(per_rank_params):
-                    offset = 0
-                    bucket = self.buckets[sharded_optimizer][device][dst_rank]
-                    bucket.destination = dst_rank
+                    # Devise the bucketing strategy
+                    bucketed_params = []
+                    bucket_size = 0
 
                     for param in filter(lambda x: x.requires_grad is True, params):
                         # Criteria to decide whether this parameter is to be bucketed or not:
                         # - enough room in the bucket
-                        if (offset + param.numel()) < self.buffer_max_size:
+                        if (bucket_size + param.numel()) < self.buffer_max_size:
                             self._should_bucket_grad.append(True)
+                            bucketed_params.append(param)
+                            bucket_size += param.numel()
+                        else:
+                            self._should_bucket_grad.append(False)
 
-                            # This parameter gradients becomes a view of the bucket
-                            offset_next = offset + param.numel()
-
-                            if param.grad is None:
-                                # will be overwritten just below, see next line
-                                param.grad = torch.zeros_like(param)
-
-                            param.grad.data = bucket.buffer[offset:offset_next].view_as(param.data)
-                            offset = offset_next
-
-                            # Update the bucket
-                            self._reduced_grads_max[sharded_optimizer] -= 1  # one less reduce call per bucketed grad
-                            self.buckets[sharded_optimizer][device][dst_rank].max_params_checked_in += 1
+                    # Allocate the bucket, no space is lost in the end
+                    bucket = Bucket(
+                        buffer=torch.zeros(bucket_size, dtype=per_rank_params[0][0].dtype, device=device)
+                    )
+                    bucket.destination = dst_rank
+                    self.buckets[sharded_optimizer][device].append(bucket)
 
+                    offset = 0
+                    for param in bucketed_params:
+                        # This parameter gradients becomes a view of the bucket
+                        offset_next = offset + param.numel()
+
+                        grad_view = bucket.buffer[offset:offset_next].view_as(param.data)
+                        if param.grad is None:
+                            # Use the view straight away, no need for a full size temporary grad
+                            param.grad = grad_view
                         else:
-                            self._should_bucket_grad.append(False)
+                            param.grad.data = grad_view
+                        offset = offset_next
+
+                        # Update the bucket
+                        self._reduced_grads_max[sharded_optimizer] -= 1  # one less reduce call per bucketed grad
+                        bucket.max_params_checked_in += 1
 
-                    # Resize the bucket to remove lost space in the end
-                    bucket.buffer.resize_(offset)
                     if bucket.max_params_checked_in > 0:
                         self._reduced_grads_max[sharded_optimizer] += 1  # one reduce call per bucket
@@ -3,23 +3,29 @@
 # This source code is licensed under the BSD license found in the
 # LICENSE file in the root directory of this source tree.
 
-from collections import OrderedDict, deque
-import copy
-import itertools
+from collections import OrderedDict, defaultdict, deque
+import heapq
 from itertools import chain
 import logging
 from math import inf
-from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple, Type, Union
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Type, Union
 
 import torch
 import torch.distributed as dist
 from torch.nn import Parameter
 from torch.optim import SGD, Optimizer
 
-from .utils import Workhandle, broadcast_object, recursive_copy_to_device
+from .utils import Workhandle, all_gather_object, pack_state, recursive_copy_to_device, unpack_state
 
 __all__ = ["OSS"]
 
+# The fused multi-tensor kernels are only exposed by recent Pytorch versions
+_foreach_available = hasattr(torch, "_foreach_norm")
+_foreach_mul_available = hasattr(torch, "_foreach_mul_")
+
+# All-gather into a single flat tensor, exposed under a private name in between Pytorch 1.8 and 1.13
+_all_gather_into_tensor = getattr(dist, "all_gather_into_tensor", getattr(dist, "_all_gather_base", None))
+
 if TYPE_CHECKING:  # pragma: no cover
     from torch.optim.optimizer import _params_t
 else:
@@ -52,9 +58,12 @@ class OSS(Optimizer):
         group (group):
             torch.distributed group (default: group.WORLD)
         broadcast_buffer_size (int):
-            the max size of the buffer used to batch the small parameter tensors, in number of elements (default 16M).
-            this will not impact the long term memory consumption, but the peak memory can be impacted by the moment
-            when the buffers are allocated and the bucketed params have not yet been relocated to them.
+            the max size of the buffers used to batch the parameter tensors, in number of elements (default 16M).
+            the parameters become views of these buffers, so this will not impact the long term memory consumption,
+            but the peak memory can be impacted by the moment when a buffer is allocated and its params have not yet
+            been relocated to it. With NCCL on recent Pytorch versions, the trainable parameters are instead synced
+            with a single all_gather call per device and dtype, as long as the padding needed to even out the shards
+            fits in this size.
     """
 
     #: The optimizer used for a given shard
@@ -81,11 +90,20 @@ class OSS(Optimizer):
         self._param_rank: Dict[torch.Tensor, int] = {}
         self._partition_parameters: List[List[dict]] = []
 
+        # All the params flattened, with the index of their param group, and sorted by size.
+        # These only change when param groups are added
+        self._flat_params: List[Parameter] = []
+        self._flat_param_group_idx: List[int] = []
+        self._params_by_size: List[Parameter] = []
+
         # Build the wrapped optimizer, responsible for a shard of the params
         self.group = group if group is not None else dist.group.WORLD
         self.world_size = dist.get_world_size(self.group)
         self.rank = dist.get_rank(self.group)
-        self.global_rank = self.get_global_rank(self.group, self.rank)
+
+        # The group to global rank mapping is static, look it up once
+        self._global_ranks: List[int] = [self.get_global_rank(self.group, r) for r in range(self.world_size)]
+        self.global_rank = self._global_ranks[self.rank]
         self.optim = optim(self.partition_parameters()[self.rank], **default)
 
         # - Sync local and global param_groups keys
@@ -99,11 +117,24 @@ class OSS(Optimizer):
 
         # Current default device is set by the parameters allocated to this rank
         self._device = list(self.per_device_params.keys())[0]
-        self.buckets: Dict[torch.device, List[torch.Tensor]] = {}
+        self.buckets: Dict[torch.device, List[List[torch.Tensor]]] = {}  # device, rank, buckets
+        self._flat_broadcast_plan: List[Tuple[torch.Tensor, int]] = []  # bucket, global source rank
+        self._flat_all_gather_plan: List[Tuple[torch.Tensor, torch.Tensor]] = []  # output, this rank's shard
         self.buffer_max_size = broadcast_buffer_size
 
-        self.should_bucket_param: List[bool] = []
+        # Most models live on a single device, the per device bookkeeping can then be skipped at runtime.
+        # Refreshed alongside the buckets
+        self._single_device = len(self.per_device_params) == 1
+
         self.work_handles: Deque[Workhandle] = deque()
+
+        # With NCCL and recent Pytorch versions:
+        # - the work handles expose futures, which can be waited on in one go
+        # - the shards can be synced with a single all_gather per device and dtype, instead of per rank broadcasts
+        backend = dist.get_backend(self.group)
+        self._use_futures = hasattr(torch, "futures") and backend == dist.Backend.NCCL
+        self._use_all_gather = _all_gather_into_tensor is not None and backend == dist.Backend.NCCL
+
         self._setup_bucket_strategy()
 
     # Partition helpers
@@ -114,32 +145,63 @@ class OSS(Optimizer):
         element of the list contains the param_groups for a rank. Element 0
         corresponds to rank 0, etc. We need all the ranks for the broadcast
         inside step().
+
+        The per device and per rank params, as well as the param to rank mapping, are built alongside.
         """
         if len(self._partition_parameters) == 0:
             self._partition_parameters = [list() for _ in range(self.world_size)]
-            sizes = [0] * self.world_size
-            for param_group in self.param_groups:
-                param_lists: List[List] = [list() for _ in range(self.world_size)]
-                for param in param_group["params"]:
-                    # Add this param to rank with smallest size.
-                    rank = sizes.index(min(sizes))
-                    param_lists[rank].append(param)
-
-                    # We're partitioning the optimizer state,
-                    # so trainable parameters are the ones which really count
-                    if param.requires_grad:
-                        sizes[rank] += param.numel()
-                    else:
-                        # Spread frozen params on a per-tensor basis
-                        # Mostly useful for balance partitions for fine tuning for instance
-                        # Not required strictly speaking
-                        sizes[rank] += 1
-
-                for rank, params in enumerate(param_lists):
-                    param_group_rank = copy.copy(param_group)
+
+            # Min-heap of (size, rank), ties are broken by the smallest rank
+            sizes = [(0, rank) for rank in range(self.world_size)]
+            heapq.heapify(sizes)
+
+            if len(self._flat_params) == 0:
+                self._flat_params = [p for param_group in self.param_groups for p in param_group["params"]]
+                self._flat_param_group_idx = [
+                    i for i, param_group in enumerate(self.param_groups) for _ in param_group["params"]
+                ]
+
+            # Params per param group, then per rank
+            param_lists: List[List[List]] = [[list() for _ in range(self.world_size)] for _ in self.param_groups]
+
+            for param, group_idx in zip(self._flat_params, self._flat_param_group_idx):
+                # Add this param to rank with smallest size.
+                size, rank = heapq.heappop(sizes)
+                param_lists[group_idx][rank].append(param)
+                self._param_rank[param] = rank
+
+                if param.device not in self._per_device_params:
+                    self._per_device_params[param.device] = [[] for _ in range(self.world_size)]
+
+                # We're partitioning the optimizer state,
+                # so trainable parameters are the ones which really count
+                if param.requires_grad:
+                    size += param.numel()
+                else:
+                    # Spread frozen params on a per-tensor basis
+                    # Mostly useful for balance partitions for fine tuning for instance
+                    # Not required strictly speaking
+                    size += 1
+
+                heapq.heappush(sizes, (size, rank))
+
+            for param_group, group_param_lists in zip(self.param_groups, param_lists):
+                for rank, params in enumerate(group_param_lists):
+                    param_group_rank = param_group.copy()
                     param_group_rank["params"] = params
                     self._partition_parameters[rank].append(param_group_rank)
 
+            # Log the params per device and per rank, sorted by size to allow for an easy bucketing.
+            # The ordering is important here, needs to be the same on all ranks
+            # So that ulterior broadcast calls are matching
+            if len(self._params_by_size) == 0:
+                self._params_by_size = sorted(self._flat_params, key=lambda x: x.numel())
+
+            for param in self._params_by_size:
+                self._per_device_params[param.device][self._param_rank[param]].append(param)
+
+            logging.debug("ZeRO: Parameters dispatched to ranks %s " % list(self._param_rank.values()))
+
         return self._partition_parameters
 
     @property
@@ -149,20 +211,7 @@ class OSS(Optimizer):
         Within a list params are sorted per number of elements to allow for an easy bucketing.
         """
         if len(self._per_device_params) == 0:
-            # Go through all params, log them per device
-            # The ordering is important here, needs to be the same on all ranks
-            # So that ulterior broadcast calls are matching
-            for param_group in self.param_groups:
-                for param in param_group["params"]:
-                    device = param.device
-                    if self._per_device_params.get(device) is None:
-                        self._per_device_params[device] = [[] for _ in range(self.world_size)]
-                    self._per_device_params[device][self.param_to_rank[param]] += [param]
-
-            # Sort param_lists by size
-            for device in self._per_device_params.keys():
-                for rank_params in self._per_device_params[device]:
-                    rank_params.sort(key=lambda x: x.numel())
+            self.partition_parameters()
 
         return self._per_device_params
 
@@ -170,15 +219,22 @@ class OSS(Optimizer):
     def param_to_rank(self) -> Dict[torch.Tensor, int]:
         """param to data parallel rank"""
         if len(self._param_rank) == 0:
-            for rank, param_groups in enumerate(self.partition_parameters()):
-                for param_group in param_groups:
-                    for param in param_group["params"]:
-                        self._param_rank[param] = rank
-
-            logging.debug("ZeRO: Parameters dispatched to ranks %s " % list(self._param_rank.values()))
+            self.partition_parameters()
 
         return self._param_rank
 
+    def _clear_cache(self) -> None:
+        """Force a re-partitioning, the partition and the related lookups are rebuilt when next requested"""
+        self._partition_parameters.clear()
+        self._per_device_params.clear()
+        self._param_rank.clear()
+
+    def _clear_flat_params(self) -> None:
+        """The flat views on the param groups are rebuilt when next partitioning"""
+        self._flat_params.clear()
+        self._flat_param_group_idx.clear()
+        self._params_by_size.clear()
+
     # NOTE(msb) We add a kwargs in order to support Optimizer sub-classes that support extra kwargs.
     # For example, the apex library contains fused optimizers with a step that supports extra kwargs.
     def step(self, closure: Optional[Callable[[], float]] = None, **kwargs: Any) -> Optional[float]:
@@ -236,13 +292,14 @@ class OSS(Optimizer):
         max_norm = float(max_norm)
         norm_type = float(norm_type)
 
-        # Filter out the grad-less params, concatenate params from all devices
-        local_params = itertools.chain(
-            *[
-                list(filter(lambda x: x.grad is not None, device_params[self.rank]))
-                for device_params in self.per_device_params.values()
-            ]
-        )
+        # Filter out the grad-less params once, per device. The lists are reused for the clipping
+        local_grad_params = [
+            [p for p in device_params[self.rank] if p.grad is not None]
+            for device_params in self.per_device_params.values()
+        ]
+
+        # Concatenate params from all devices
+        local_params: Iterable[Parameter] = [p for device_grad_params in local_grad_params for p in device_grad_params]
 
         # Option to filter parameters from the grad_norm calculation. This is useful for model parallelism.
         # To avoid double counting, only consider parameters on rank zero + anything marked 'model_parallel'
@@ -253,16 +310,13 @@ class OSS(Optimizer):
 
         # Compute the norm on this grad set,
         # then sync all the norms from all ranks
+        local_norm = self._local_grad_norm(local_params, norm_type)
+
         if norm_type == inf:
-            total_norm = max(p.grad.detach().abs().max().to(self._device) for p in local_params)  # type: ignore
+            total_norm = local_norm
             # all reduce over data parallel and model parallel workers
             dist.all_reduce(total_norm, op=torch.distributed.ReduceOp.MAX, group=dist.group.WORLD)
         else:
-            local_norm = torch.norm(
-                input=torch.stack([torch.norm(input=p.grad.detach(), p=norm_type, dtype=torch.float32).to(self._device) for p in local_params]),  # type: ignore
-                p=norm_type,
-            )
-
             # local norm result can be accumulated with the remote ones if put to the right power
             # n_i = sum_rank(a^p)^1/p
             # -> n_total = all_reduce(n_i^p)^(1/p) = sum_i(n_i^p)^1/p = sum_i(sum_rank(a^p))^1/p
@@ -273,12 +327,70 @@ class OSS(Optimizer):
 
         clip_coef = torch.tensor(max_norm, dtype=total_norm.dtype, device=total_norm.device) / (total_norm + 1e-6)
         if clip_coef < 1:
-            for device, device_params in self.per_device_params.items():
-                for p in filter(lambda x: x.grad is not None, device_params[self.rank]):
-                    p.grad.detach().mul_(clip_coef.to(device))  # type: ignore
+            # The comparison above already synced the coefficient to the host,
+            # scaling by a python scalar saves a copy of the coefficient per device
+            scale = clip_coef.item()
+            for device_grad_params in local_grad_params:
+                grads = [p.grad.detach() for p in device_grad_params]  # type: ignore
+                if len(grads) == 0:
+                    # Nothing to clip on this device, for instance if this shard only holds frozen params
+                    continue
+
+                if _foreach_mul_available:
+                    torch._foreach_mul_(grads, scale)
+                else:
+                    for grad in grads:
+                        grad.mul_(scale)
 
         return total_norm
 
+    def _local_grad_norm(self, params: Iterable[Parameter], norm_type: float) -> torch.Tensor:
+        """Norm of the gradients of the given params, as if they were concatenated into a single vector.
+
+        The per-gradient norms are computed with one fused kernel per device if possible,
+        only the per-device norms are moved to the default device.
+        """
+
+        if self._single_device:
+            # Common case, all the grads already live on the default device
+            grads = [p.grad.detach() for p in params]  # type: ignore
+            if len(grads) == 0:
+                return torch.tensor(0.0, dtype=torch.float32, device=self._device)
+
+            return torch.norm(input=torch.stack(self._grad_norms(grads, norm_type)), p=norm_type)
+
+        grads_per_device: Dict[torch.device, List[torch.Tensor]] = defaultdict(list)
+        for p in params:
+            grads_per_device[p.grad.device].append(p.grad.detach())  # type: ignore
+
+        if len(grads_per_device) == 0:
+            return torch.tensor(0.0, dtype=torch.float32, device=self._device)
+
+        device_norms = [
+            torch.norm(input=torch.stack(self._grad_norms(grads, norm_type)), p=norm_type).to(self._device)
+            for grads in grads_per_device.values()
+        ]
+
+        return torch.norm(input=torch.stack(device_norms), p=norm_type)
+
+    @staticmethod
+    def _grad_norms(grads: List[torch.Tensor], norm_type: float) -> List[torch.Tensor]:
+        """Per-tensor norms in fp32, for a list of grads living on the same device.
+
+        The fused kernel computes the norms in the grad dtype, so it is only used for the fp32 grads.
+        Reduced precision grads are accumulated in fp32, which avoids overflows and precision losses.
+        """
+        fp32_grads = [g for g in grads if g.dtype == torch.float32]
+        other_grads = [g for g in grads if g.dtype != torch.float32]
+
+        norms = [torch.norm(input=g, p=norm_type, dtype=torch.float32) for g in other_grads]  # type: ignore
+        if _foreach_available and len(fp32_grads) > 0:
+            norms.extend(torch._foreach_norm(fp32_grads, norm_type))
+        else:
+            norms.extend(torch.norm(input=g, p=norm_type, dtype=torch.float32) for g in fp32_grads)  # type: ignore
+
+        return norms
+
     # State dict interfaces
     def local_state_dict(self) -> dict:
         """Gets this rank's state_dict.
@@ -301,82 +413,70 @@ class OSS(Optimizer):
         # Sync lr and other attributes in case its been updated
         self._sync_param_groups()
 
-        if self.rank == recipient_rank:
-            # Pull the sharded state from all the other replicas
-            # Store all the states in order, rank by rank
-            logging.debug("Pulling the sharded optimizer state from all replicas")
-            self._all_states = self._collect_sharded_states()
-        else:
-            # Acknowledge broadcasts, and send this rank's shard when needed
-            self._broadcast_state_dict()
-
-    def _broadcast_state_dict(self) -> None:
-        """Broadcast this rank's state shard, discard others"""
-
-        # Default to CPU space to gain some memory headroom
-        local_cpu_state = recursive_copy_to_device(
-            self.local_state_dict(), non_blocking=True, device=torch.device("cpu")
-        )
-
-        # Tensor cannot be really empty, even if its size is meaningless
-        dummy_sync_tensor = torch.tensor([1], device=self._device)
-
-        for rank in range(self.world_size):
-            if rank == self.rank:
-                # Send the state to the reference replica
-                logging.debug(
-                    "Sending the sharded optimizer state to the reference replica from rank %s", rank,
-                )
-                # legacy compatibility for old torch versions
-                broadcast_object(
-                    self.local_state_dict(), src_rank=self.global_rank, group=self.group, dist_device=self._device
-                )
-            else:
-                global_rank = self.get_global_rank(self.group, rank)
-
-                # Discard this tensor/rank, broadcast necessary for syncing and because NCCL does not support gather
-                broadcast_object(
-                    torch.tensor([dummy_sync_tensor], dtype=torch.uint8, device=self._device),
-                    src_rank=global_rank,
-                    group=self.group,
-                    dist_device=self._device,
-                )
-
-    def _collect_sharded_states(self) -> List[Dict[str, Any]]:
-        """Collect all the state shards, in CPU memory."""
-        all_states = []
-
-        for rank in range(self.world_size):
-            if rank == self.rank:
-                logging.debug("Saving self state")
-                all_states.append(
-                    recursive_copy_to_device(self.local_state_dict(), non_blocking=True, device=torch.device("cpu"))
-                )
+        # All the replicas take part in the same collective calls,
+        # only the recipient keeps the states in order, rank by rank
+        logging.debug("Pulling the sharded optimizer state from all replicas")
+        all_states = self._collect_sharded_states(recipient_rank)
 
-                # Sync with other replicas
-                broadcast_object(
-                    torch.tensor([0], dtype=torch.uint8, device=self._device),
-                    src_rank=self.global_rank,
-                    group=self.group,
-                    dist_device=self._device,
-                )
-            else:
-                # Fetch the optim state from the other replicas
-                global_rank = self.get_global_rank(self.group, rank)
-                replica_state = broadcast_object(
-                    torch.tensor([0], dtype=torch.uint8, device=self._device),
-                    src_rank=global_rank,
-                    group=self.group,
-                    dist_device=self._device,
-                )
+        if self.rank == recipient_rank:
+            self._all_states = all_states
 
-                all_states.append(
-                    recursive_copy_to_device(replica_state, non_blocking=True, device=torch.device("cpu"))
-                )
+    def _collect_sharded_states(self, recipient_rank: int) -> List[Dict[str, Any]]:
+        """Collect all the state shards on the recipient rank, in CPU memory. The other ranks get an empty list.
 
-                logging.debug("State from rank %s received", rank)
+        The tensors of each shard are packed in one flat tensor per dtype and broadcast directly,
+        only the lightweight skeleton of the states goes through pickle.
+        """
 
-        return all_states
+        skeleton, flat_tensors = pack_state(self.local_state_dict(), device=self._device)
+        sizes = {dtype: tensor.numel() for dtype, tensor in flat_tensors.items()}
+        all_skeletons = all_gather_object((skeleton, sizes), group=self.group, dist_device=self._device)
+
+        # One broadcast per source rank and per dtype, so that at most one shard's worth of a given dtype
+        # is in flight on the devices at any point in time
+        is_recipient = self.rank == recipient_rank
+        all_flat_tensors: List[Dict[torch.dtype, torch.Tensor]] = [{} for _ in range(self.world_size)]
+
+        # The device to host copies go through one page-locked staging buffer per dtype,
+        # the consolidated state itself is kept in pageable memory
+        staging_buffers: Dict[torch.dtype, torch.Tensor] = {}
+        if is_recipient and self._device.type == "cuda":
+            max_sizes: Dict[torch.dtype, int] = defaultdict(int)
+            for _, src_sizes in all_skeletons:
+                for dtype, size in src_sizes.items():
+                    max_sizes[dtype] = max(max_sizes[dtype], size)
+
+            staging_buffers = {
+                dtype: torch.empty((size,), dtype=dtype, pin_memory=True) for dtype, size in max_sizes.items()
+            }
+
+        for src_rank, (_, src_sizes) in enumerate(all_skeletons):
+            for dtype, size in src_sizes.items():
+                if src_rank == self.rank:
+                    buffer = flat_tensors[dtype]
+                else:
+                    buffer = torch.empty(size, dtype=dtype, device=self._device)
+
+                dist.broadcast(buffer, src=self._global_ranks[src_rank], group=self.group)
+
+                if not is_recipient:
+                    continue
+
+                if dtype in staging_buffers:
+                    staging = staging_buffers[dtype][:size]
+                    staging.copy_(buffer, non_blocking=True)
+                    torch.cuda.current_stream(self._device).synchronize()
+                    all_flat_tensors[src_rank][dtype] = staging.clone()
+                else:
+                    all_flat_tensors[src_rank][dtype] = buffer
+
+        if not is_recipient:
+            return []
+
+        return [
+            unpack_state(rank_skeleton, rank_flat_tensors)
+            for (rank_skeleton, _), rank_flat_tensors in zip(all_skeletons, all_flat_tensors)
+        ]
 
     def state_dict(self) -> Dict[str, Any]:
         """Return the last known global optimizer state, which consist of a list of the shards.
@@ -453,9 +553,7 @@ class OSS(Optimizer):
                     global_group[k] = v
 
         # Force a re-partitioning, in case the model changed with the new state
-        self._partition_parameters.clear()
-        self._per_device_params.clear()
-        self._param_rank.clear()
+        self._clear_cache()
 
         # Update the bucketing strategy accordingly
         self._setup_bucket_strategy()
@@ -491,9 +589,8 @@ class OSS(Optimizer):
         super().add_param_group(param_group)
         if not self.in_super_constructor:
             # Force a re-partitioning
-            self._partition_parameters.clear()
-            self._per_device_params.clear()
-            self._param_rank.clear()
+            self._clear_cache()
+            self._clear_flat_params()
 
             param_groups = self.partition_parameters()[self.rank]
             if len(param_groups) == len(self.optim.param_groups) + 1:
@@ -519,7 +616,7 @@ class OSS(Optimizer):
 
         for global_group, local_group in zip(self.param_groups, self.optim.param_groups):
             # Sync everything but the parameters
-            for k in filter(lambda x: x != "params", local_group.keys()):
+            for k in [key for key in local_group.keys() if key != "params"]:
                 if local_to_global:
                     global_group[k] = local_group[k]
                 elif k in global_group.keys():
@@ -529,25 +626,18 @@ class OSS(Optimizer):
     def _broadcast_params(self) -> None:
         """Helper function to broadcast all the parameters from a given device"""
 
-        i_param = 0
         last_work_handle = None  # Work handles are consumed within this scope, no callback
 
-        for (device, device_params,) in self.per_device_params.items():  # all the params on this device (inc all ranks)
-            buckets = self.buckets[device]
-            # Bucket and issue all the async calls
-            for (src_rank, params), bucket in zip(enumerate(device_params), buckets):
-                global_src_rank = self.get_global_rank(self.group, src_rank)
-
-                # Direct broadcasts only
-                for param in params:
-                    if not self.should_bucket_param[i_param]:
-                        last_work_handle = dist.broadcast(
-                            tensor=param.data, src=global_src_rank, group=self.group, async_op=True
-                        )
-
-                    i_param += 1
-
-                # Bucket broadcasts
+        # The all_gather plan is empty if the bucketed broadcasts are used
+        if self._flat_all_gather_plan:
+            # Each rank's shard is a slice of the output, which all the params are views of
+            for output, shard in self._flat_all_gather_plan:
+                last_work_handle = _all_gather_into_tensor(  # type: ignore
+                    output, shard, group=self.group, async_op=True
+                )
+        else:
+            # The parameters are views of the buckets, so that broadcasting the buckets syncs all the params
+            for bucket, global_src_rank in self._flat_broadcast_plan:
                 last_work_handle = dist.broadcast(tensor=bucket, src=global_src_rank, group=self.group, async_op=True)
 
         # Only check on the last handle, they're all inlined on the same CUDA stream
@@ -556,12 +646,20 @@ class OSS(Optimizer):
 
     def _consume_work_handles(self) -> None:
         """Consume all the futures which are tied to this optimizer's buckets.
-        We start from the first/older ones, since they are the most likely to be ready and non-blocking
+        All the handles are waited on in one go when they expose a future, the callbacks are then executed in order
         """
 
+        if len(self.work_handles) == 0:
+            return
+
+        if self._use_futures and hasattr(self.work_handles[0].handle, "get_future"):
+            _ = torch.futures.wait_all([work_handle.handle.get_future() for work_handle in self.work_handles])
+        else:
+            for work_handle in self.work_handles:
+                work_handle.handle.wait()
+
         while len(self.work_handles) > 0:
             work_handle = self.work_handles.popleft()
-            work_handle.handle.wait()
             if work_handle.callback is not None:
                 work_handle.callback()
 
@@ -573,14 +671,15 @@ class OSS(Optimizer):
                 work_handle.callback()
 
     def _setup_bucket_strategy(self) -> None:
-        """Tag parameters to either bucket them or broadcast/reduce them directly. The parameters are ordered
-        (smallest first), the bucket will hold the smallest elements, the remaining ones will be directly sent
-        over the wire.
+        """Flatten the parameters into contiguous buckets, per device and per rank. The parameters are ordered
+        (smallest first) and become views of the buckets, so that a single broadcast call syncs a whole bucket.
 
         Generating the partition once and for all allows us to save some time at runtime, and to know when all the
         network requests have been issued.
         """
 
+        self._single_device = len(self.per_device_params) == 1
+
         # (re) allocate the buckets
         #  - Get the correct size for the buckets, cannot be bigger than the model
         model_size = sum([p.numel() for p in self.param_to_rank.keys()])
@@ -591,33 +690,143 @@ class OSS(Optimizer):
             )
         )
 
-        # - Allocate one buffer per rank and per device to group the small parameters
-        for device, per_device in self.per_device_params.items():
-            self.buckets[device] = [
-                torch.zeros(self.bucket_size, dtype=per_device[0][0].dtype, device=device)
-                for _ in range(len(per_device))
-            ]
+        self._flat_all_gather_plan = []
+        self._flat_broadcast_plan = []
 
-        # Devise the bucketing strategy
+        if self._use_all_gather and self._setup_all_gather_buffers():
+            return
+
+        # - Group the params per device and per rank, each group becomes a flat bucket
         for device, per_rank_params in self.per_device_params.items():
-            for dst_rank, params in enumerate(per_rank_params):
-                offset = 0
+            self.buckets[device] = []
+
+            for params in per_rank_params:
+                rank_buckets: List[torch.Tensor] = []
 
-                for param in params:
-                    # Criteria to decide whether this parameter is to be bucketed or not:
-                    # - enough room in the bucket
-                    if param.requires_grad and (offset + param.numel()) < self.bucket_size:
-                        self.should_bucket_param.append(True)
+                for bucket_params in self._group_params(params, self.bucket_size):
+                    # Pack all the params in the bucket in one go
+                    bucket = torch.cat([p.data.reshape(-1) for p in bucket_params])
 
+                    offset = 0
+                    for param in bucket_params:
                         # This parameter becomes a view of the bucket
                         offset_next = offset + param.numel()
+                        param.data = bucket[offset:offset_next].view_as(param.data)
+                        offset = offset_next
 
-                        self.buckets[device][dst_rank][offset:offset_next].copy_(param.data.flatten())
-                        param.data = self.buckets[device][dst_rank][offset:offset_next].view_as(param.data)
+                    rank_buckets.append(bucket)
 
-                        offset = offset_next
-                    else:
-                        self.should_bucket_param.append(False)
+                self.buckets[device].append(rank_buckets)
+
+        # - Flatten the broadcast order, all the ranks go through the buckets in the same order
+        self._flat_broadcast_plan = [
+            (bucket, self._global_ranks[src_rank])
+            for device_buckets in self.buckets.values()
+            for src_rank, buckets in enumerate(device_buckets)
+            for bucket in buckets
+        ]
+
+    def _setup_all_gather_buffers(self) -> bool:
+        """Flatten the trainable parameters into one buffer per device and per dtype. Each rank owns a slice of this
+        buffer, padded to the same size for all ranks, so that a single all_gather call syncs all the params.
+
+        The frozen parameters never change, they are left out. If the padding would take more than
+        `broadcast_buffer_size` elements nothing is done and False is returned, the bucketed broadcasts are then used.
+        """
+
+        layouts = [
+            (device, dtype, per_rank_dtype_params, shard_size)
+            for device, per_rank_params in self.per_device_params.items()
+            for dtype, (per_rank_dtype_params, shard_size) in self._all_gather_layout(per_rank_params).items()
+        ]
+
+        padding = sum(
+            self.world_size * shard_size - sum(p.numel() for params in per_rank_dtype_params for p in params)
+            for _, _, per_rank_dtype_params, shard_size in layouts
+        )
+        if padding > self.buffer_max_size:
+            logging.info(
+                "Unbalanced shards, {:.2f}M elements of padding would be needed to all_gather them. "
+                "Falling back to broadcasts".format(padding / 2 ** 20)
+            )
+            return False
+
+        for device in self.per_device_params.keys():
+            self.buckets[device] = [[] for _ in range(self.world_size)]
+
+        for device, dtype, per_rank_dtype_params, shard_size in layouts:
+            output = self._flatten_shards(per_rank_dtype_params, shard_size, dtype, device)
+
+            for rank in range(self.world_size):
+                self.buckets[device][rank].append(output[rank * shard_size : (rank + 1) * shard_size])
+
+            self._flat_all_gather_plan.append((output, self.buckets[device][self.rank][-1]))
+
+        return True
+
+    @staticmethod
+    def _all_gather_layout(
+        per_rank_params: List[List[Parameter]],
+    ) -> Dict[torch.dtype, Tuple[List[List[Parameter]], int]]:
+        """Group the trainable params per dtype then per rank, alongside the padded shard size for this dtype.
+        The dtypes are ordered the same way on all ranks, so that the collective calls match.
+        """
+
+        layout: Dict[torch.dtype, Tuple[List[List[Parameter]], int]] = OrderedDict()
+        dtypes = OrderedDict.fromkeys(p.dtype for params in per_rank_params for p in params if p.requires_grad)
+
+        for dtype in dtypes:
+            per_rank_dtype_params = [
+                [p for p in params if p.dtype == dtype and p.requires_grad] for params in per_rank_params
+            ]
+            shard_size = max(sum(p.numel() for p in params) for params in per_rank_dtype_params)
+            layout[dtype] = (per_rank_dtype_params, shard_size)
+
+        return layout
+
+    @staticmethod
+    def _flatten_shards(
+        per_rank_params: List[List[Parameter]], shard_size: int, dtype: torch.dtype, device: torch.device
+    ) -> torch.Tensor:
+        """Pack the params in one buffer, each rank's slice being padded to `shard_size`.
+        The params become views of this buffer.
+        """
+
+        flat_chunks = []
+        for params in per_rank_params:
+            flat_chunks.extend([p.data.reshape(-1) for p in params])
+            flat_chunks.append(torch.zeros(shard_size - sum(p.numel() for p in params), dtype=dtype, device=device))
+        output = torch.cat(flat_chunks)
+
+        for rank, params in enumerate(per_rank_params):
+            offset = rank * shard_size
+            for param in params:
+                # This parameter becomes a view of the buffer
+                offset_next = offset + param.numel()
+                param.data = output[offset:offset_next].view_as(param.data)
+                offset = offset_next
+
+        return output
+
+    @staticmethod
+    def _group_params(params: List[Parameter], max_size: int) -> List[List[Parameter]]:
+        """Split the params in groups of the same dtype, holding at most `max_size` elements.
+        A param bigger than `max_size` gets a group of its own.
+        """
+
+        groups: List[List[Parameter]] = []
+        open_groups: Dict[torch.dtype, Tuple[List[Parameter], int]] = {}
+
+        for param in params:
+            group, size = open_groups.get(param.dtype, ([], 0))
+
+            if len(group) > 0 and size + param.numel() > max_size:
+                group, size = [], 0
+
+            if len(group) == 0:
+                groups.append(group)
+
+            group.append(param)
+            open_groups[param.dtype] = (group, size + param.numel())
 
-                # Resize the bucket to remove lost space in the end
-                self.buckets[device][dst_rank].resize_(offset)
+        return groups
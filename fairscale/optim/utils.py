@@ -3,8 +3,9 @@
 # This source code is licensed under the BSD license found in the
 # LICENSE file in the root directory of this source tree.
 
+from collections import defaultdict
 import io
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import torch
 from torch._six import container_abcs
@@ -78,6 +79,97 @@ def broadcast_object(
     return obj
 
 
+# backward compatibility - this is needed for torch 1.6 which does not expose this functionality
+# FIXME: to be dropped alongside torch1.6 support, when time comes
+def all_gather_object(
+    obj: Any, group: Any = dist.group.WORLD, dist_device: torch.device = torch.device("cpu")
+) -> List[Any]:
+    """
+    Gather the objects from all the ranks in a single rendez-vous, the result is ordered rank by rank.
+    The gathered objects are loaded in CPU memory.
+    """
+
+    buffer = io.BytesIO()
+    torch.save(obj, buffer)
+    data = bytearray(buffer.getbuffer())
+    world_size = dist.get_world_size(group)
+
+    # Exchange the payload sizes, the transfers are padded to the biggest one
+    length_tensor = torch.LongTensor([len(data)]).to(dist_device)
+    length_tensors = [torch.zeros_like(length_tensor) for _ in range(world_size)]
+    dist.all_gather(length_tensors, length_tensor, group=group)
+    lengths = torch.cat(length_tensors).tolist()
+
+    data_send_tensor = torch.zeros([max(lengths)], dtype=torch.uint8, device=dist_device)
+    data_send_tensor[: len(data)] = torch.ByteTensor(data).to(dist_device)
+    data_recv_tensors = [torch.empty_like(data_send_tensor) for _ in range(world_size)]
+    dist.all_gather(data_recv_tensors, data_send_tensor, group=group)
+
+    objects = []
+    for length, data_recv_tensor in zip(lengths, data_recv_tensors):
+        buffer = io.BytesIO(data_recv_tensor[:length].cpu().numpy())
+        objects.append(torch.load(buffer, map_location=torch.device("cpu")))
+
+    return objects
+
+
+def pack_state(value: Any, device: torch.device) -> Tuple[Dict[str, Any], Dict[torch.dtype, torch.Tensor]]:
+    """
+    Split a (nested) state into a lightweight skeleton and one flat tensor per dtype, living on `device`.
+
+    In the skeleton the tensors are replaced by empty placeholders of the same dtype, their shapes are listed
+    in traversal order. This is the reverse of `unpack_state`.
+    """
+
+    tensors: Dict[torch.dtype, List[torch.Tensor]] = defaultdict(list)
+    shapes: List[Tuple[int, ...]] = []
+
+    def _pack(val: Any) -> Any:
+        if isinstance(val, torch.Tensor):
+            tensors[val.dtype].append(val.detach().reshape(-1).to(device))
+            shapes.append(tuple(val.shape))
+            return torch.empty(0, dtype=val.dtype)
+
+        if isinstance(val, (list, tuple)):
+            values = [_pack(v) for v in val]
+            return values if isinstance(val, list) else tuple(values)
+
+        if isinstance(val, container_abcs.Mapping):
+            return {k: _pack(v) for k, v in val.items()}
+
+        return val
+
+    skeleton = {"state": _pack(value), "shapes": shapes}
+    return skeleton, {dtype: torch.cat(dtype_tensors) for dtype, dtype_tensors in tensors.items()}
+
+
+def unpack_state(skeleton: Dict[str, Any], flat_tensors: Dict[torch.dtype, torch.Tensor]) -> Any:
+    """
+    Rebuild a state packed by `pack_state`, the tensors are views of the flat per dtype tensors.
+    """
+
+    shapes: Iterator[Tuple[int, ...]] = iter(skeleton["shapes"])
+    offsets: Dict[torch.dtype, int] = defaultdict(int)
+
+    def _unpack(val: Any) -> Any:
+        if isinstance(val, torch.Tensor):
+            shape = torch.Size(next(shapes))
+            offset = offsets[val.dtype]
+            offsets[val.dtype] = offset + shape.numel()
+            return flat_tensors[val.dtype][offset : offset + shape.numel()].view(shape)
+
+        if isinstance(val, (list, tuple)):
+            values = [_unpack(v) for v in val]
+            return values if isinstance(val, list) else tuple(values)
+
+        if isinstance(val, container_abcs.Mapping):
+            return {k: _unpack(v) for k, v in val.items()}
+
+        return val
+
+    return _unpack(skeleton["state"])
+
+
 class Bucket:
     """
     Helper class to simplify the handling of broadcast or reduce buckets
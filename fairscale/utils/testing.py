@@ -30,8 +30,10 @@ import inspect
 import logging
 import multiprocessing
 import os
+import queue
 import random
 import tempfile
+import traceback
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy
@@ -284,6 +286,110 @@ def torch_spawn(world_sizes: Optional[List[int]] = None) -> Callable:
     return prepare_test
 
 
+def _pool_worker_loop(rank: int, task_queue: Any, done_queue: Any) -> None:
+    """Main function of the WorkerPool processes, runs the submitted tests until told to stop"""
+
+    # The tests are written for fresh processes, save the initial RNG states to restore them in between tests
+    torch_seed = torch.initial_seed()
+    random_state = random.getstate()
+    numpy_state = numpy.random.get_state()
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+
+        torch.manual_seed(torch_seed)
+        random.setstate(random_state)
+        numpy.random.set_state(numpy_state)
+
+        func, args = task
+        try:
+            func(rank, *args)
+            done_queue.put((rank, None))
+        except BaseException:
+            done_queue.put((rank, traceback.format_exc()))
+        finally:
+            # Hand over a clean slate to the next test, whatever this one did
+            if torch.distributed.is_initialized():
+                torch.distributed.destroy_process_group()
+
+
+class WorkerPool:
+    """
+    Long lived worker processes, one per rank, which run the distributed tests in turn. This is a drop in replacement
+    for `mp.spawn(func, args, nprocs)`, which saves the interpreter start, the imports and the CUDA context creation
+    in between tests. Each test still initializes and destroys its own process group.
+
+    Workers are started on demand. If a rank fails or dies, the other ones are likely to be stuck in a collective,
+    so all the workers are terminated and the error is raised.
+
+    .. note: The ranks cannot be threads of a single process, even with Gloo. The default process group is a
+        per process global, so each rank needs its own process.
+    """
+
+    #: How often the workers are checked on while waiting for a test to complete, in seconds
+    POLL_INTERVAL = 1.0
+
+    def __init__(self) -> None:
+        self._context = multiprocessing.get_context("spawn")
+        self._done_queue = self._context.Queue()
+        self._task_queues: List[Any] = []
+        self._workers: List[Any] = []
+
+    def run(self, func: Callable, args: Tuple = (), nprocs: int = 1) -> None:
+        """Run `func(rank, *args)` on the first `nprocs` workers, blocks until all of them are done"""
+
+        while len(self._workers) < nprocs:
+            task_queue = self._context.Queue()
+            worker = self._context.Process(
+                target=_pool_worker_loop, args=(len(self._workers), task_queue, self._done_queue), daemon=True
+            )
+            worker.start()
+            self._task_queues.append(task_queue)
+            self._workers.append(worker)
+
+        for task_queue in self._task_queues[:nprocs]:
+            task_queue.put((func, args))
+
+        pending = nprocs
+        while pending > 0:
+            try:
+                rank, error = self._done_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                # A worker which was killed (segfault, OOM killer..) will never report back, check on them
+                for rank, worker in enumerate(self._workers[:nprocs]):
+                    if not worker.is_alive():
+                        exitcode = worker.exitcode
+                        self.terminate()
+                        raise RuntimeError(f"Rank {rank} died running {func.__name__}, exit code {exitcode}")
+                continue
+
+            if error is not None:
+                self.terminate()
+                raise RuntimeError(f"Rank {rank} failed running {func.__name__}:\n{error}")
+            pending -= 1
+
+    def terminate(self) -> None:
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+
+        self._done_queue = self._context.Queue()
+        self._task_queues.clear()
+        self._workers.clear()
+
+    def close(self) -> None:
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+
+        for worker in self._workers:
+            worker.join()
+
+        self._task_queues.clear()
+        self._workers.clear()
+
+
 class _Block(nn.Module):
     def __init__(self, embed_dim: int, num_heads: int) -> None:
         super().__init__()
@@ -32,6 +32,7 @@ from . import testing as testing
 #MODIFIED BY TORCHGPIPE
 from . import backends
 from . import distributed
+from . import futures as futures
 from . import version
 #END
 
@@ -992,6 +993,8 @@ def _empty_per_channel_affine_quantized(size: _size, *, scales: Tensor, zero_poi
 @overload
 def _empty_per_channel_affine_quantized(*size: _int, scales: Tensor, zero_points: Tensor, axis: _int, memory_format: Optional[memory_format]=contiguous_format, dtype: _dtype=None, layout: _layout=strided, device: Union[_device, _int, str, None]=None, requires_grad:_bool=False) -> Tensor: ...
 def _fft_with_size(self: Tensor, signal_ndim: _int, complex_input: _bool, complex_output: _bool, inverse: _bool, checked_signal_sizes: _size, normalized: _bool, onesided: _bool, output_sizes: _size) -> Tensor: ...
+def _foreach_norm(tensors: List[Tensor], ord: Number=2) -> List[Tensor]: ...
+def _foreach_mul_(tensors: List[Tensor], scalar: Number) -> None: ...
 def _fused_dropout(self: Tensor, p: _float, generator: Generator=None) -> Tuple[Tensor, Tensor]: ...
 def _has_compatible_shallow_copy_type(self: Tensor, from_: Tensor) -> _bool: ...
 def _index_copy_(self: Tensor, dim: _int, index: Tensor, source: Tensor) -> Tensor: ...
@@ -1265,7 +1268,7 @@ def empty(size: _size, *, names: Optional[List[Union[str, None]]], memory_format
 @overload
 def empty(*size: _int, names: Optional[List[Union[str, None]]], memory_format: Optional[memory_format]=None, out: Optional[Tensor]=None, dtype: _dtype=None, layout: _layout=strided, device: Union[_device, _int, str, None]=None, requires_grad:_bool=False) -> Tensor: ...
 @overload
-def empty(size: _size, *, memory_format: Optional[memory_format]=None, out: Optional[Tensor]=None, dtype: _dtype=None, layout: _layout=strided, device: Union[_device, _int, str, None]=None, requires_grad:_bool=False) -> Tensor: ...
+def empty(size: _size, *, memory_format: Optional[memory_format]=None, out: Optional[Tensor]=None, dtype: _dtype=None, layout: _layout=strided, device: Union[_device, _int, str, None]=None, requires_grad:_bool=False, pin_memory:_bool=False) -> Tensor: ...
 @overload
 def empty(*size: _int, memory_format: Optional[memory_format]=None, out: Optional[Tensor]=None, dtype: _dtype=None, layout: _layout=strided, device: Union[_device, _int, str, None]=None, requires_grad:_bool=False) -> Tensor: ...
 @overload
@@ -43,6 +43,8 @@ def all_to_all(output: List[Tensor], input: List[Tensor], group:Optional[Process
 def all_to_all_single(output: Tensor, input: Tensor, output_split_size: Optional[List[int]] = None, input_split_size: Optional[List[int]] = None, group:Optional[ProcessGroup] = None, async_op: bool = False): ...
 def all_reduce(tensor: Tensor, op: ReduceOp = ReduceOp.SUM, group:Optional[ProcessGroup] = None, async_op: bool = False): ...
 def all_gather(tensor_list: List[Tensor], tensor: Tensor, group:Optional[ProcessGroup] = None, async_op: bool = False): ...
+def all_gather_into_tensor(output_tensor: Tensor, input_tensor: Tensor, group:Optional[ProcessGroup] = None, async_op: bool = False): ...
+def _all_gather_base(output_tensor: Tensor, input_tensor: Tensor, group:Optional[ProcessGroup] = None, async_op: bool = False): ...
 
 def destroy_process_group() -> None: ...
 
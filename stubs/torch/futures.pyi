@@ -1,6 +1,9 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
 
-from typing import Any
+from typing import Any, List
 
 class Future:
     def wait(self) -> Any: ...
+
+def collect_all(futures: List[Future]) -> Future: ...
+def wait_all(futures: List[Future]) -> List[Any]: ...
@@ -0,0 +1,30 @@
+# Copyright (c) Facebook, Inc. and its affiliates. All rights reserved.
+#
+# This source code is licensed under the BSD license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+from typing import Iterator
+
+import pytest
+
+from fairscale.utils.testing import WorkerPool
+
+
+@pytest.fixture(scope="session")
+def worker_pool() -> Iterator[WorkerPool]:
+    pool = WorkerPool()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def rendezvous_file() -> Iterator[str]:
+    # A fresh file per test for the process group rendezvous, the descriptor is not leaked
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    yield path
+
+    if os.path.exists(path):
+        os.unlink(path)
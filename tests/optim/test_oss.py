@@ -10,23 +10,24 @@
 
 import copy
 from math import inf
-import tempfile
 from typing import Type, cast
 import unittest
 
-import numpy as np
 import pytest
 import torch
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 import torch.distributed as dist
-import torch.multiprocessing as mp
 from torch.nn.parallel import DistributedDataParallel as DDP
 
 import fairscale.optim as optim
-from fairscale.utils.testing import skip_if_no_cuda, skip_if_single_gpu
+from fairscale.utils.testing import skip_if_no_cuda, skip_if_single_gpu, torch_version
 
 BACKEND = dist.Backend.NCCL if torch.cuda.is_available() else dist.Backend.GLOO  # type: ignore
 DEVICE = "cuda" if torch.cuda.is_available() else torch.device("cpu")
 
+# Dropping the grads skips one zeroing kernel per param, only possible with recent Pytorch versions
+ZERO_GRAD_KWARGS = {"set_to_none": True} if torch_version() >= (1, 7, 0) else {}
+
 try:
     from torch.distributed import broadcast_object_list  # noqa
 
@@ -39,19 +40,68 @@ except ImportError:
 
 def dist_init(rank, world_size, tempfile_name, backend=BACKEND):
     url = "file://" + tempfile_name
+
+    if backend == dist.Backend.NCCL:
+        # Bind each rank to its GPU upfront, so that NCCL sets up its communicators on the right device
+        torch.cuda.set_device(rank)
+
     dist.init_process_group(init_method=url, backend=backend, rank=rank, world_size=world_size)
 
 
+def all_reduce_grads(params, world_size):
+    # Average the grads in between the ranks, with a single collective call
+    grads = [p.grad.data for p in params]
+    flat_grads = _flatten_dense_tensors(grads)
+    dist.all_reduce(flat_grads, op=dist.ReduceOp.SUM)
+    flat_grads /= world_size
+
+    for grad, synced_grad in zip(grads, _unflatten_dense_tensors(flat_grads, grads)):
+        grad.copy_(synced_grad)
+
+
+def assert_allclose(tensors, ref_tensors, message, **kwargs):
+    # Compare all the tensors at once, a single host sync instead of one per tensor
+    tensors, ref_tensors = list(tensors), list(ref_tensors)
+    assert len(tensors) == len(ref_tensors), message
+    flat, ref_flat = torch.cat([t.reshape(-1) for t in tensors]), torch.cat([t.reshape(-1) for t in ref_tensors])
+    assert torch.allclose(flat, ref_flat, **kwargs), message
+
+
+class _CompletedWork:
+    # Stand-in for the handles returned by the asynchronous collectives
+    def wait(self):
+        return True
+
+
+def _single_rank_collective(tensor, *args, async_op=False, **kwargs):
+    return _CompletedWork() if async_op else None
+
+
+def _single_rank_all_gather(tensor_list, tensor, group=None, async_op=False):
+    tensor_list[0].copy_(tensor)
+    return _CompletedWork() if async_op else None
+
+
+@pytest.fixture
+def single_rank_no_dist(monkeypatch):
+    # A single rank has nothing to communicate, stub the process group out instead of paying for its rendezvous
+    monkeypatch.setattr(dist, "is_initialized", lambda: True)
+    monkeypatch.setattr(dist, "get_rank", lambda group=None: 0)
+    monkeypatch.setattr(dist, "get_world_size", lambda group=None: 1)
+    monkeypatch.setattr(dist, "get_backend", lambda group=None: dist.Backend.GLOO)
+    monkeypatch.setattr(dist, "broadcast", _single_rank_collective)
+    monkeypatch.setattr(dist, "all_reduce", _single_rank_collective)
+    monkeypatch.setattr(dist, "all_gather", _single_rank_all_gather)
+
+
+@pytest.mark.usefixtures("single_rank_no_dist")
 class TestSingleRank(unittest.TestCase):
     """
     All the following tests do not check for inter-process communication
     """
 
     def setUp(self):
-        dist_init(0, 1, tempfile.mkstemp()[1])
-
-    def tearDown(self):
-        torch.distributed.destroy_process_group()
+        torch.manual_seed(0)
 
     def test_create(self):
         params = [torch.rand(1)]
@@ -64,7 +114,7 @@ class TestSingleRank(unittest.TestCase):
         o.step()
         assert x == torch.tensor([0.9], device=DEVICE)
         assert o.optim.state[x]["momentum_buffer"] == torch.tensor([1.0], device=DEVICE)
-        o.zero_grad()
+        o.zero_grad(**ZERO_GRAD_KWARGS)
         o.consolidate_state_dict()  # Sync state dict in between replicas - even if there are none
         state_dict = o.state_dict()
 
@@ -110,11 +160,11 @@ class TestSingleRank(unittest.TestCase):
         s2 = torch.optim.lr_scheduler.StepLR(o2, 1)
         for _ in range(5):
             x.backward()
-            o.zero_grad()
+            o.zero_grad(**ZERO_GRAD_KWARGS)
             o.step()
             s.step()
             x2.backward()
-            o2.zero_grad()
+            o2.zero_grad(**ZERO_GRAD_KWARGS)
             o2.step()
             s2.step()
             assert x == x2
@@ -184,6 +234,21 @@ class TestSingleRank(unittest.TestCase):
         o.step()
         assert x == torch.tensor([0.9], device=DEVICE)
 
+    def test_clip_grad_norm_reduced_precision(self):
+        # The grad norms are accumulated in fp32, this one would overflow in fp16
+        for dtype in [torch.float16, torch.bfloat16]:
+            x = torch.zeros(10000, dtype=dtype, device=DEVICE, requires_grad=True)
+            x.grad = torch.full_like(x, 1000.0)
+            o = optim.OSS([x], lr=0.1)
+
+            total_norm = o.clip_grad_norm(1.0)
+            assert total_norm.dtype == torch.float32
+            assert torch.allclose(total_norm.cpu(), torch.tensor(1e5), rtol=1e-3), f"{dtype}: {total_norm}"
+
+            # The grads have been scaled down, not zeroed
+            assert torch.isfinite(x.grad).all() and (x.grad != 0).all()
+            assert torch.allclose(torch.norm(x.grad.float()).cpu(), torch.tensor(1.0), rtol=1e-2)
+
 
 def run_test_add_param_group(rank, world_size, tempfile_name):
     dist_init(rank, world_size, tempfile_name)
@@ -235,13 +300,12 @@ def run_test_add_param_group(rank, world_size, tempfile_name):
     dist.destroy_process_group()
 
 
-def test_add_param_group():
+def test_add_param_group(worker_pool, rendezvous_file):
     world_size = 4
     if torch.cuda.is_available() and torch.cuda.device_count() < world_size:
         world_size = min(world_size, torch.cuda.device_count())
 
-    temp_file_name = tempfile.mkstemp()[1]
-    mp.spawn(run_test_add_param_group, args=(world_size, temp_file_name), nprocs=world_size, join=True)
+    worker_pool.run(run_test_add_param_group, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_test_zero_grad(rank, world_size, tempfile_name):
@@ -253,20 +317,23 @@ def run_test_zero_grad(rank, world_size, tempfile_name):
     y.backward(x)
     assert m.weight.grad
     assert m.bias.grad
-    o.zero_grad()
-    assert not m.weight.grad
-    assert not m.bias.grad
+    o.zero_grad(**ZERO_GRAD_KWARGS)
+    if ZERO_GRAD_KWARGS:
+        assert m.weight.grad is None
+        assert m.bias.grad is None
+    else:
+        assert not m.weight.grad
+        assert not m.bias.grad
 
     dist.destroy_process_group()
 
 
-def test_zero_grad():
+def test_zero_grad(worker_pool, rendezvous_file):
     world_size = 2
     if torch.cuda.is_available() and torch.cuda.device_count() < world_size:
         world_size = min(world_size, torch.cuda.device_count())
 
-    temp_file_name = tempfile.mkstemp()[1]
-    mp.spawn(run_test_zero_grad, args=(world_size, temp_file_name), nprocs=world_size, join=True)
+    worker_pool.run(run_test_zero_grad, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_test_step(rank, world_size, tempfile_name):
@@ -279,22 +346,20 @@ def run_test_step(rank, world_size, tempfile_name):
     o = optim.OSS(m.parameters(), lr=0.1)
     y = m(x)
     y.backward(x)
-    for p in m.parameters():
-        dist.all_reduce(p.grad.data, op=dist.ReduceOp.SUM)
-        p.grad.data /= world_size
+    all_reduce_grads(m.parameters(), world_size)
     o.step()
-    assert m.weight == torch.tensor([[0.75]], device=rank)
-    assert m.bias == torch.tensor([1.85], device=rank)
+
+    # Check all the values with a single transfer to the host
+    updated = torch.cat([m.weight.detach().reshape(-1), m.bias.detach().reshape(-1)]).cpu()
+    assert torch.allclose(updated, torch.tensor([0.75, 1.85]))
 
     dist.destroy_process_group()
 
 
 @skip_if_single_gpu
-def test_step():
+def test_step(worker_pool, rendezvous_file):
     world_size = 2
-    temp_file_name = tempfile.mkstemp()[1]
-
-    mp.spawn(run_test_step, args=(world_size, temp_file_name), nprocs=world_size, join=True)
+    worker_pool.run(run_test_step, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_test_step_with_closure(rank, world_size, tempfile_name, optimizer=None):
@@ -317,12 +382,10 @@ def run_test_step_with_closure(rank, world_size, tempfile_name, optimizer=None):
 
     y = m(x)
     y.backward(x)
-    for p in m.parameters():
-        dist.all_reduce(p.grad.data, op=dist.ReduceOp.SUM)
-        p.grad.data /= world_size
+    all_reduce_grads(m.parameters(), world_size)
 
     def closure():
-        o.zero_grad()
+        o.zero_grad(**ZERO_GRAD_KWARGS)
         output = m(x)
         loss = loss_fn(output, target)
         loss.backward()
@@ -330,19 +393,17 @@ def run_test_step_with_closure(rank, world_size, tempfile_name, optimizer=None):
 
     loss = o.step(closure=closure)
 
-    assert loss == torch.tensor(error, device=rank)
-    assert m.weight == torch.tensor([[1.1]], device=rank)
-    assert m.bias == torch.tensor([2.1], device=rank)
+    # Check all the values with a single transfer to the host
+    updated = torch.cat([loss.detach().reshape(-1), m.weight.detach().reshape(-1), m.bias.detach().reshape(-1)]).cpu()
+    assert torch.allclose(updated, torch.tensor([error, 1.1, 2.1]))
 
     dist.destroy_process_group()
 
 
 @skip_if_no_cuda
-def test_step_with_closure():
+def test_step_with_closure(worker_pool, rendezvous_file):
     world_size = min(2, torch.cuda.device_count())
-    temp_file_name = tempfile.mkstemp()[1]
-
-    mp.spawn(run_test_step_with_closure, args=(world_size, temp_file_name), nprocs=world_size, join=True)
+    worker_pool.run(run_test_step_with_closure, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_test_sharding(rank, world_size, tempfile_name):
@@ -361,13 +422,11 @@ def run_test_sharding(rank, world_size, tempfile_name):
     dist.destroy_process_group()
 
 
-def test_sharding():
+def test_sharding(worker_pool, rendezvous_file):
     world_size = 3
     if not torch.cuda.is_available() or torch.cuda.device_count() < world_size:
         pytest.skip("Not enough GPUs for NCCL-based test")
-    temp_file_name = tempfile.mkstemp()[1]
-
-    mp.spawn(run_test_sharding, args=(world_size, temp_file_name), nprocs=world_size, join=True)
+    worker_pool.run(run_test_sharding, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_test_collect_shards(rank, world_size, reference_rank, tempfile_name):
@@ -389,7 +448,7 @@ def run_test_collect_shards(rank, world_size, reference_rank, tempfile_name):
     optimizer = optim.OSS(model.parameters(), lr=0.1, momentum=0.99)
 
     def closure():
-        optimizer.zero_grad()
+        optimizer.zero_grad(**ZERO_GRAD_KWARGS)
         output = model(inputs)
         loss = loss_fn(output, target)
         loss.backward()
@@ -406,34 +465,183 @@ def run_test_collect_shards(rank, world_size, reference_rank, tempfile_name):
     if rank == reference_rank:
         optimizer_state_dict = optimizer.state_dict()
         assert len(optimizer_state_dict["state"]) == world_size
+        assert_state_on_cpu(optimizer_state_dict)
     else:
         optimizer_state_dict = {}
 
-    optim_state = [optimizer_state_dict]
-    if _torch_broadcast_object:
-        dist.broadcast_object_list(optim_state, src=reference_rank, group=dist.group.WORLD)
-        optimizer_state_dict = optim_state[0]
-    else:
-        optimizer_state_dict = optim.utils.broadcast_object(
-            optimizer_state_dict, src_rank=reference_rank, group=dist.group.WORLD, dist_device=device
-        )
+    optimizer_state_dict = broadcast_state_dict(optimizer_state_dict, src_rank=reference_rank, device=device)
 
     # Load the optimizer state dict
     optimizer.load_state_dict(optimizer_state_dict)
     dist.destroy_process_group()
 
 
-def test_collect_shards():
-    world_size = 3
-    temp_file_name = tempfile.mkstemp()[1]
+def assert_state_on_cpu(state_dict):
+    # The consolidated state should not hold on to any device memory
+    for rank_state in state_dict["state"]:
+        for param_state in rank_state.values():
+            for value in param_state.values():
+                if torch.is_tensor(value):
+                    assert value.device.type == "cpu", "The consolidated state should be kept on CPU"
+
+
+def broadcast_state_dict(state_dict, src_rank, device):
+    # Only the lightweight skeleton of the state goes through pickle,
+    # the tensors are broadcast directly, one flat tensor per dtype.
+    # NCCL requires device tensors, the result is moved back to CPU dtype by dtype to keep the device memory in check
+    if dist.get_backend() != dist.Backend.NCCL:
+        device = torch.device("cpu")
+
+    if dist.get_rank() == src_rank:
+        skeleton, flat_tensors = optim.utils.pack_state(state_dict, device=device)
+        metadata = [(skeleton, {dtype: tensor.numel() for dtype, tensor in flat_tensors.items()})]
+    else:
+        metadata = [None]
+
+    if _torch_broadcast_object:
+        dist.broadcast_object_list(metadata, src=src_rank, group=dist.group.WORLD)
+    else:
+        metadata = [
+            optim.utils.broadcast_object(metadata[0], src_rank=src_rank, group=dist.group.WORLD, dist_device=device)
+        ]
+
+    skeleton, sizes = metadata[0]
+    if dist.get_rank() != src_rank:
+        flat_tensors = {dtype: torch.empty(size, dtype=dtype, device=device) for dtype, size in sizes.items()}
+
+    for dtype in sizes.keys():
+        dist.broadcast(flat_tensors[dtype], src=src_rank, group=dist.group.WORLD)
+        flat_tensors[dtype] = flat_tensors[dtype].cpu()
+
+    return optim.utils.unpack_state(skeleton, flat_tensors)
 
+
+def test_collect_shards(worker_pool, rendezvous_file):
+    world_size = 3
     if torch.cuda.is_available():
         world_size = min(world_size, torch.cuda.device_count())
     reference_rank = 0
 
-    mp.spawn(
-        run_test_collect_shards, args=(world_size, reference_rank, temp_file_name), nprocs=world_size, join=True,
-    )
+    worker_pool.run(run_test_collect_shards, args=(world_size, reference_rank, rendezvous_file), nprocs=world_size)
+
+
+def assert_same_state(state, ref_state):
+    # Walk both states side by side, the containers and the tensor dtypes and shapes should be preserved
+    if torch.is_tensor(ref_state):
+        assert torch.is_tensor(state)
+        assert state.dtype == ref_state.dtype and state.shape == ref_state.shape
+        assert torch.equal(state.cpu(), ref_state.cpu())
+    elif isinstance(ref_state, (list, tuple)):
+        assert type(state) == type(ref_state) and len(state) == len(ref_state)
+        for value, ref_value in zip(state, ref_state):
+            assert_same_state(value, ref_value)
+    elif isinstance(ref_state, dict):
+        assert state.keys() == ref_state.keys()
+        for key in ref_state.keys():
+            assert_same_state(state[key], ref_state[key])
+    else:
+        assert state == ref_state
+
+
+def test_pack_state():
+    # Mixed dtypes, nested containers, 0-d tensors and non tensor leaves
+    state = {
+        "state": {
+            0: {
+                "step": torch.tensor(3),
+                "exp_avg": torch.rand(2, 3),
+                "exp_avg_sq": torch.rand(2, 3).half(),
+                "mask": torch.rand(4) > 0.5,
+            },
+            1: {"momentum_buffer": None, "nested": [torch.rand(2), (torch.tensor(1.0), "tag", 7)]},
+        },
+        "param_groups": [{"lr": 0.1, "betas": (0.9, 0.999), "params": [0, 1]}],
+    }
+
+    skeleton, flat_tensors = optim.utils.pack_state(state, device=torch.device("cpu"))
+
+    # One flat tensor per dtype, holding all the data
+    assert set(flat_tensors.keys()) == {torch.float32, torch.float16, torch.int64, torch.bool}
+    assert flat_tensors[torch.float32].numel() == 2 * 3 + 2 + 1
+    assert flat_tensors[torch.float16].numel() == 2 * 3
+
+    unpacked = optim.utils.unpack_state(skeleton, flat_tensors)
+    assert_same_state(unpacked, state)
+    assert unpacked["state"][0]["step"].dim() == 0
+
+    # The unpacked tensors are views of the flat ones
+    flat_tensors[torch.float16].zero_()
+    assert unpacked["state"][0]["exp_avg_sq"].abs().sum() == 0
+
+
+@skip_if_no_cuda
+def test_pack_state_mixed_devices():
+    # Adam's layout on recent Pytorch versions: the step lives on CPU, next to the moments on the device
+    state = {
+        "step": torch.tensor(5.0),
+        "exp_avg": torch.rand(3, 2, device="cuda"),
+        "exp_avg_sq": torch.rand(3, 2, device="cuda"),
+    }
+
+    for device in [torch.device("cuda"), torch.device("cpu")]:
+        skeleton, flat_tensors = optim.utils.pack_state(state, device=device)
+        assert all(t.device.type == device.type for t in flat_tensors.values())
+        assert_same_state(optim.utils.unpack_state(skeleton, flat_tensors), state)
+
+
+def test_all_gather_layout():
+    # Unbalanced shards over 3 ranks, with two dtypes and a big frozen param
+    frozen = torch.nn.Parameter(torch.rand(100), requires_grad=False)
+    per_rank_params = [
+        [torch.nn.Parameter(torch.rand(2, 3)), frozen],
+        [torch.nn.Parameter(torch.rand(4)), torch.nn.Parameter(torch.rand(5).half())],
+        [torch.nn.Parameter(torch.rand(1))],
+    ]
+    ref_values = {p: p.detach().clone() for params in per_rank_params for p in params}
+
+    layout = optim.OSS._all_gather_layout(per_rank_params)
+
+    # The frozen param is left out, it would otherwise set the shard size for all ranks
+    assert list(layout.keys()) == [torch.float32, torch.float16]
+    float_params, float_shard_size = layout[torch.float32]
+    assert float_shard_size == 6 and [len(params) for params in float_params] == [1, 1, 1]
+    half_params, half_shard_size = layout[torch.float16]
+    assert half_shard_size == 5 and [len(params) for params in half_params] == [0, 1, 0]
+
+    # One padded slice per rank, the params keep their values and become views of their rank's slice
+    output = optim.OSS._flatten_shards(float_params, float_shard_size, torch.float32, torch.device("cpu"))
+    assert output.numel() == 3 * float_shard_size
+
+    for rank, params in enumerate(float_params):
+        for param in params:
+            offset = (param.data_ptr() - output.data_ptr()) // output.element_size()
+            assert rank * float_shard_size <= offset and offset + param.numel() <= (rank + 1) * float_shard_size
+            assert torch.equal(param.data, ref_values[param])
+
+    output.zero_()
+    assert all(param.abs().sum() == 0 for params in float_params for param in params)
+    assert torch.equal(frozen.data, ref_values[frozen])
+
+
+def run_test_all_gather_object(rank, world_size, tempfile_name):
+    dist_init(rank, world_size, tempfile_name, backend=dist.Backend.GLOO)
+
+    # The payloads have different sizes, to exercise the padding
+    obj = {"rank": rank, "payload": "x" * (100 * rank), "tensor": torch.full((rank + 1,), float(rank))}
+    objects = optim.utils.all_gather_object(obj, group=dist.group.WORLD, dist_device=torch.device("cpu"))
+
+    assert len(objects) == world_size
+    for r, gathered in enumerate(objects):
+        assert_same_state(
+            gathered, {"rank": r, "payload": "x" * (100 * r), "tensor": torch.full((r + 1,), float(r))},
+        )
+
+    dist.destroy_process_group()
+
+
+def test_all_gather_object(worker_pool, rendezvous_file):
+    world_size = 3
+    worker_pool.run(run_test_all_gather_object, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_test_multiple_groups(rank, world_size, tempfile_name):
@@ -442,24 +650,25 @@ def run_test_multiple_groups(rank, world_size, tempfile_name):
     sub_group_ranks = [0, 2, 4]
     process_group = torch.distributed.new_group(ranks=sub_group_ranks, backend="gloo")
 
-    # Make sure that all the ranks get different training data
-    # So that the sync check in between their models is meaningful
-    torch.manual_seed(rank)
-    np.random.seed(rank)
-
     # Standard deep learning setup
     device = "cpu"
+
+    # Make sure that all the ranks get different training data
+    # So that the sync check in between their models is meaningful
+    generator = torch.Generator(device=device).manual_seed(rank)
     epochs, batch, input_width, hidden, target_width = 5, 3, 20, 10, 5
     loss_fn = torch.nn.L1Loss().to(device)
 
+    # The same data is used for all the models
+    targets = [torch.rand((batch, target_width), generator=generator, device=device) for _ in range(epochs)]
+    inputs_per_epoch = [torch.rand((batch, input_width), generator=generator, device=device) for _ in range(epochs)]
+
     def check(optimizer):
         # Just run a couple of epochs, check that the model is properly updated
-        for _ in range(epochs):
-            target = torch.rand((batch, target_width), device=device)
-            inputs = torch.rand((batch, input_width), device=device)
+        for target, inputs in zip(targets, inputs_per_epoch):
 
             def closure():
-                optimizer.zero_grad()
+                optimizer.zero_grad(**ZERO_GRAD_KWARGS)
                 output = model(inputs)
                 loss = loss_fn(output, target)
                 loss /= world_size
@@ -470,18 +679,15 @@ def run_test_multiple_groups(rank, world_size, tempfile_name):
 
             _ = optimizer.step(closure=closure)
 
-            # Check that all the params are the same on all ranks
-            for pg in optimizer.param_groups:
-                for p in pg["params"]:
-                    receptacle = [p.clone() for _ in sub_group_ranks] if rank == 0 else []
-                    dist.gather(p, receptacle, dst=0, group=process_group)
-                    if rank == 0:
-                        for sync_p in receptacle[1:]:
-                            assert torch.all(
-                                torch.eq(receptacle[0], sync_p)
-                            ), "Models differ in between ranks {} - {}".format(
-                                torch.norm(receptacle[0]), torch.norm(sync_p)
-                            )
+            # Check that all the params are the same on all ranks, all of them are gathered in one go
+            flat_params = _flatten_dense_tensors([p for pg in optimizer.param_groups for p in pg["params"]])
+            receptacle = [torch.empty_like(flat_params) for _ in sub_group_ranks] if rank == 0 else []
+            dist.gather(flat_params, receptacle, dst=0, group=process_group)
+            if rank == 0:
+                for sync_p in receptacle[1:]:
+                    assert torch.all(torch.eq(receptacle[0], sync_p)), "Models differ in between ranks {} - {}".format(
+                        torch.norm(receptacle[0]), torch.norm(sync_p)
+                    )
 
     if rank in sub_group_ranks:
         # Model fitting in the broadcast bucket
@@ -507,49 +713,52 @@ def run_test_multiple_groups(rank, world_size, tempfile_name):
     dist.destroy_process_group(process_group)
 
 
-def test_multiple_groups():
+def test_multiple_groups(worker_pool, rendezvous_file):
     world_size = 6
-    temp_file_name = tempfile.mkstemp()[1]
-
-    mp.spawn(
-        run_test_multiple_groups, args=(world_size, temp_file_name), nprocs=world_size, join=True,
-    )
+    worker_pool.run(run_test_multiple_groups, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_gradient_clipping(rank, world_size, tempfile_name):
     dist_init(rank, world_size, tempfile_name, backend="gloo")
     device = torch.device(rank)
-    torch.manual_seed(rank)  # make sure that the different rank get different data
+    generator = torch.Generator(device=device).manual_seed(rank)  # make sure that the different rank get different data
 
     # Run a dummy step so that the optimizer state dict exists
     batch, input_width, hidden, target_width = 3, 20, 10, 5
-    target = torch.rand((batch, target_width), device=device)
-    inputs = torch.rand((batch, input_width), device=device)
+    target = torch.rand((batch, target_width), generator=generator, device=device)
+    inputs = torch.rand((batch, input_width), generator=generator, device=device)
     NORMS = [1.0, 2.0, 1, 2, inf]
     CLIP_NORM = 0.3
 
-    def check(norm):
-        model_oss = torch.nn.Sequential(
+    def build_model():
+        return torch.nn.Sequential(
             torch.nn.Linear(input_width, hidden),
             torch.nn.Linear(hidden, hidden),
             torch.nn.Linear(hidden, target_width),
         ).to(device)
-        model = copy.deepcopy(model_oss)
 
-        # For this test the gradients are (all) reduced in the same way in between the torch reference and fairscale.
-        # Normally OSS would use ShardedDDP and only reduce to the proper rank, but this does not change the
-        # gradient norm computation from OSS and adds a dependency.
-        # to keep the comparison apples-to-apples DDP is used in both cases
-        model_oss = DDP(module=model_oss, device_ids=[rank],)
-        sharded_optimizer = optim.OSS(model_oss.parameters(), lr=0.1, momentum=0.99)
+    # For this test the gradients are (all) reduced in the same way in between the torch reference and fairscale.
+    # Normally OSS would use ShardedDDP and only reduce to the proper rank, but this does not change the
+    # gradient norm computation from OSS and adds a dependency.
+    # to keep the comparison apples-to-apples DDP is used in both cases
+    model_oss = DDP(module=build_model(), device_ids=[rank],)
+    sharded_optimizer = optim.OSS(model_oss.parameters(), lr=0.1, momentum=0.99)
 
-        model = DDP(model, device_ids=[rank],)
+    model = DDP(build_model(), device_ids=[rank],)
 
-        loss_fn = torch.nn.L1Loss()
-        loss_fn.to(device)
+    # The models are built once, and reset to the same state in between the checks.
+    # The snapshot is taken after the DDP wrap, so that it is the same on all ranks
+    initial_sd = {k: v.detach().clone() for k, v in model_oss.module.state_dict().items()}
 
-        model.zero_grad()
-        model_oss.zero_grad()
+    loss_fn = torch.nn.L1Loss()
+    loss_fn.to(device)
+
+    def check(norm):
+        model.module.load_state_dict(initial_sd)
+        model_oss.module.load_state_dict(initial_sd)
+
+        model.zero_grad(**ZERO_GRAD_KWARGS)
+        model_oss.zero_grad(**ZERO_GRAD_KWARGS)
 
         outputs = model(inputs)
         outputs_oss = model_oss(inputs)
@@ -567,8 +776,16 @@ def run_gradient_clipping(rank, world_size, tempfile_name):
 
         # Check that the params have indeed been clipped
         for params in sharded_optimizer.per_device_params.values():
-            for param in filter(lambda x: x.grad is not None, params[rank]):
-                assert torch.norm(param.grad, p=norm) < CLIP_NORM, f"param grad norm above clip : {param.grad}"
+            grads = [p.grad for p in params[rank] if p.grad is not None]
+            if len(grads) == 0:
+                continue
+
+            if hasattr(torch, "_foreach_norm"):
+                norms = torch._foreach_norm(grads, norm)
+            else:
+                norms = [torch.norm(g, p=norm) for g in grads]
+
+            assert torch.stack(norms).lt(CLIP_NORM).all(), f"param grad norm above clip : {norms}"
 
     for norm in NORMS:
         print(f"Checking norm {norm}")
@@ -578,28 +795,24 @@ def run_gradient_clipping(rank, world_size, tempfile_name):
 
 
 @skip_if_no_cuda
-def test_gradient_clipping():
+def test_gradient_clipping(worker_pool, rendezvous_file):
     world_size = 3
-    temp_file_name = tempfile.mkstemp()[1]
-
     if torch.cuda.is_available():
         world_size = min(world_size, torch.cuda.device_count())
     reference_rank = 0
 
-    mp.spawn(
-        run_gradient_clipping, args=(world_size, temp_file_name), nprocs=world_size, join=True,
-    )
+    worker_pool.run(run_gradient_clipping, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_state_dict_distributed(rank, world_size, tempfile_name):
     dist_init(rank, world_size, tempfile_name, backend="gloo")
     device = torch.device(rank)
-    torch.manual_seed(rank)  # make sure that the different rank get different data
+    generator = torch.Generator(device=device).manual_seed(rank)  # make sure that the different rank get different data
 
     # Run a dummy step so that the optimizer state dict exists
     batch, input_width, hidden, target_width = 3, 20, 10, 5
-    target = torch.rand((batch, target_width), device=device)
-    inputs = torch.rand((batch, input_width), device=device)
+    target = torch.rand((batch, target_width), generator=generator, device=device)
+    inputs = torch.rand((batch, input_width), generator=generator, device=device)
 
     model_oss1 = torch.nn.Sequential(torch.nn.Linear(input_width, hidden), torch.nn.Linear(hidden, hidden),).to(device)
     head_oss1 = torch.nn.Linear(hidden, target_width).to(device)
@@ -623,7 +836,7 @@ def run_state_dict_distributed(rank, world_size, tempfile_name):
         loss_fn = torch.nn.L1Loss()
         loss_fn.to(device)
 
-        model.zero_grad()
+        model.zero_grad(**ZERO_GRAD_KWARGS)
 
         outputs = head(model(inputs))
 
@@ -631,7 +844,7 @@ def run_state_dict_distributed(rank, world_size, tempfile_name):
         loss.backward()
 
         optimizer.step()
-        optimizer.zero_grad()
+        optimizer.zero_grad(**ZERO_GRAD_KWARGS)
 
     # save and reload without taking any steps
     sharded_optimizer2.consolidate_state_dict()
@@ -647,20 +860,28 @@ def run_state_dict_distributed(rank, world_size, tempfile_name):
     run_grad_step(device, model_oss2, head_oss2, sharded_optimizer2)
 
     # check that model parameters are equal
-    for param1, param2 in zip(model_oss1.parameters(), model_oss2.parameters()):
-        assert torch.allclose(param1, param2), "parameters of the two identical models have diverged (before any steps)"
+    assert_allclose(
+        model_oss1.parameters(),
+        model_oss2.parameters(),
+        "parameters of the two identical models have diverged (before any steps)",
+    )
 
     # take a step
     run_grad_step(device, model_oss1, head_oss1, sharded_optimizer1)
     run_grad_step(device, model_oss2, head_oss2, sharded_optimizer2)
 
     # check that model parameters are equal
-    for param1, param2 in zip(model_oss1.parameters(), model_oss2.parameters()):
-        assert torch.allclose(param1, param2), "parameters of the two identical models have diverged (before saving)"
+    assert_allclose(
+        model_oss1.parameters(),
+        model_oss2.parameters(),
+        "parameters of the two identical models have diverged (before saving)",
+    )
 
     # save the state dict for one model only
     sharded_optimizer2.consolidate_state_dict()
     state_dict2 = sharded_optimizer2.state_dict()
+    if rank == 0:
+        assert_state_on_cpu(state_dict2)
 
     # Check that the pulled state and the .param_groups attribute are in sync
     for replica in range(len(state_dict2["param_groups"])):
@@ -673,10 +894,11 @@ def run_state_dict_distributed(rank, world_size, tempfile_name):
     run_grad_step(device, model_oss2, head_oss2, sharded_optimizer2)
 
     # check that saving did not cause a change in the parameters
-    for param1, param2 in zip(model_oss1.parameters(), model_oss2.parameters()):
-        assert torch.allclose(
-            param1, param2
-        ), "parameters of the two identical models have diverged (after consolidating)"
+    assert_allclose(
+        model_oss1.parameters(),
+        model_oss2.parameters(),
+        "parameters of the two identical models have diverged (after consolidating)",
+    )
 
     # save again
     sharded_optimizer2.consolidate_state_dict()
@@ -692,77 +914,89 @@ def run_state_dict_distributed(rank, world_size, tempfile_name):
     run_grad_step(device, model_oss2, head_oss2, sharded_optimizer2)
 
     # check that reloading a saved state dict does not change the parameters
-    for param1, param2 in zip(model_oss1.parameters(), model_oss2.parameters()):
-        assert torch.allclose(param1, param2), "parameters of the two identical models have diverged (after reloading)"
+    assert_allclose(
+        model_oss1.parameters(),
+        model_oss2.parameters(),
+        "parameters of the two identical models have diverged (after reloading)",
+    )
 
     dist.destroy_process_group()
 
 
 @skip_if_no_cuda
-def test_state_dict_distributed():
+def test_state_dict_distributed(worker_pool, rendezvous_file):
     world_size = 8
-    temp_file_name = tempfile.mkstemp()[1]
-
     if torch.cuda.is_available():
         world_size = min(world_size, torch.cuda.device_count())
 
-    mp.spawn(
-        run_state_dict_distributed, args=(world_size, temp_file_name), nprocs=world_size, join=True,
-    )
+    worker_pool.run(run_state_dict_distributed, args=(world_size, rendezvous_file), nprocs=world_size)
 
 
 def run_ddp_parity(rank, world_size, backend, temp_file_name):
-    url = "file://" + temp_file_name
-    dist.init_process_group(init_method=url, backend=backend, rank=rank, world_size=world_size)
+    dist_init(rank, world_size, temp_file_name, backend=backend)
+
+    device = torch.device("cuda", rank)
+    generator = torch.Generator(device=device).manual_seed(rank)
+
+    # Any model works. Add one different buffer per rank
+    model = torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.Linear(3, 3), torch.nn.Linear(3, 3),)
+    model.register_buffer("test_buffer", torch.ones((1)) * rank)
+    model.to(device)
+    ddp_model_single = copy.deepcopy(model)
 
-    device = torch.device("cuda")
-    torch.cuda.set_device(rank)
-    torch.manual_seed(rank)
-    np.random.seed(rank)
+    # The DDP wrappers are built once, the models are reset to the same initial state for every optimizer.
+    # The DDP construction syncs the weights and buffers from rank 0, restore the per rank buffer in the snapshot
+    sharded_ddp_model = DDP(module=model, device_ids=[rank], broadcast_buffers=True)
+    ddp_model = DDP(ddp_model_single, device_ids=[rank], broadcast_buffers=True)
+
+    initial_sd = {k: v.detach().clone() for k, v in model.state_dict().items()}
+    initial_sd["test_buffer"] = torch.ones((1), device=device) * rank
 
     def check_optimizer_equivalence(optimizer: Type[torch.optim.Optimizer]):
-        # Any model works. Add one different buffer per rank
-        model = torch.nn.Sequential(torch.nn.Linear(2, 3), torch.nn.Linear(3, 3), torch.nn.Linear(3, 3),)
-        model.register_buffer("test_buffer", torch.ones((1)) * rank)
-        model.to(device)
+        model.load_state_dict(initial_sd)
+        ddp_model_single.load_state_dict(initial_sd)
 
         sharded_optimizer = optim.OSS(params=model.parameters(), optim=optimizer, lr=1e-3)
-        sharded_ddp_model = DDP(module=model, device_ids=[rank], broadcast_buffers=True)
-
-        ddp_model_single = copy.deepcopy(model)
         ddp_optimizer = optimizer(ddp_model_single.parameters(), lr=1e-3)
-        ddp_model = DDP(ddp_model_single, device_ids=[rank], broadcast_buffers=True)
 
         def check_same_model_params():
-            for pg, ddp_pg in zip(sharded_optimizer.param_groups, ddp_optimizer.param_groups):
-                for p, ddp_p in zip(pg["params"], ddp_pg["params"]):
-                    assert torch.allclose(
-                        p, ddp_p, atol=1e-3
-                    ), f"Model parameters differ in between Pytorch optim and OSS \n{p} {ddp_p}\nworld size {world_size}"
-
-            for b, ddp_b in zip(sharded_ddp_model.buffers(), ddp_model.buffers()):
-                assert torch.allclose(
-                    b, ddp_b
-                ), f"Model buffers differ in between Pytorch optim and OSS\nworld size {world_size}"
+            assert_allclose(
+                [p for pg in sharded_optimizer.param_groups for p in pg["params"]],
+                [p for pg in ddp_optimizer.param_groups for p in pg["params"]],
+                f"Model parameters differ in between Pytorch optim and OSS\nworld size {world_size}",
+                atol=1e-3,
+            )
+
+            assert_allclose(
+                sharded_ddp_model.buffers(),
+                ddp_model.buffers(),
+                f"Model buffers differ in between Pytorch optim and OSS\nworld size {world_size}",
+            )
 
         # The model should be synchronized in between the ranks at construction time, check that
         check_same_model_params()
 
+        def accumulate_grads(module, optimizer, input_tensors):
+            optimizer.zero_grad(**ZERO_GRAD_KWARGS)
+
+            # Accumulate the gradients locally, only the last micro-batch triggers the all_reduce
+            with module.no_sync():
+                for input_tensor in input_tensors[:-1]:
+                    module(input_tensor).abs().sum().backward()
+
+            loss = module(input_tensors[-1]).abs().sum()
+            loss.backward()
+            return loss
+
         # The models should stay the same in between the ranks
-        for i in range(20):
-            input_tensor = torch.rand((64, 2)).to(device)
+        for i in range(10):
+            input_tensors = [torch.rand((64, 2), generator=generator, device=device) for _ in range(2)]
 
-            def closure_ddp(input_tensor=input_tensor):
-                ddp_optimizer.zero_grad()
-                ddp_loss = ddp_model(input_tensor).abs().sum()
-                ddp_loss.backward()
-                return ddp_loss
+            def closure_ddp(input_tensors=input_tensors):
+                return accumulate_grads(ddp_model, ddp_optimizer, input_tensors)
 
-            def closure_sharded(input_tensor=input_tensor):
-                sharded_optimizer.zero_grad()
-                sharded_loss = sharded_ddp_model(input_tensor).abs().sum()
-                sharded_loss.backward()
-                return sharded_loss
+            def closure_sharded(input_tensors=input_tensors):
+                return accumulate_grads(sharded_ddp_model, sharded_optimizer, input_tensors)
 
             loss_ddp = cast(torch.Tensor, ddp_optimizer.step(closure=closure_ddp))
             loss_sharded_optim = cast(torch.Tensor, sharded_optimizer.step(closure=closure_sharded))
@@ -781,8 +1015,7 @@ def run_ddp_parity(rank, world_size, backend, temp_file_name):
 
 @skip_if_no_cuda
 @skip_if_single_gpu
-def test_ddp_parity():
-    temp_file_name = tempfile.mkstemp()[1]
+def test_ddp_parity(worker_pool, rendezvous_file):
     world_size = torch.cuda.device_count()
     backend = dist.Backend.NCCL
-    mp.spawn(run_ddp_parity, args=(world_size, backend, temp_file_name), nprocs=world_size, join=True)
+    worker_pool.run(run_ddp_parity, args=(world_size, backend, rendezvous_file), nprocs=world_size)